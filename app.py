@@ -8,6 +8,8 @@ Stack: Streamlit + SQLite + ChromaDB + Sentence Transformers + Ollama
 import streamlit as st
 import uuid
 import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 
@@ -15,15 +17,27 @@ from datetime import datetime
 import sys
 sys.path.insert(0, str(Path(__file__).parent))
 
-from config import DOCUMENTS_DIR, SUPPORTED_EXTENSIONS
-from src.document_processor import extract_text, classify_document, chunk_text, get_document_stats
-from src.entity_extractor import extract_entities, get_entity_summary, calculate_quality_score
+from config import ASSETS_DIR, DOCUMENTS_DIR, SUPPORTED_EXTENSIONS
+from src.document_processor import (
+    DocumentContext, extract_text, classify_document, chunk_text, get_document_stats
+)
+from src.entity_extractor import get_entity_summary, calculate_quality_score
 from src.database import (
-    save_document, save_entities, save_chunks, get_all_documents,
-    get_document, get_document_entities, get_statistics, delete_document
+    save_document_bundle, get_all_documents_summary, get_document_preview,
+    get_document_entities, get_statistics, delete_document
 )
 from src.rag_engine import get_rag_engine
 
+# Search filter labels -> stored document types
+DOC_TYPE_FILTERS = {
+    "All Types": None,
+    "Loan Application": "loan_application",
+    "KYC Document": "kyc_document",
+    "Bank Statement": "bank_statement",
+    "Salary Slip": "salary_slip",
+    "Other": "other",
+}
+
 # Page config
 st.set_page_config(
     page_title="Banking Doc RAG",
@@ -32,57 +46,29 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Custom CSS for better UI
-st.markdown("""
-<style>
-    .main-header {
-        font-size: 2.5rem;
-        font-weight: bold;
-        color: #1E3A5F;
-        margin-bottom: 0.5rem;
-    }
-    .sub-header {
-        font-size: 1.1rem;
-        color: #666;
-        margin-bottom: 2rem;
-    }
-    .metric-card {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        padding: 1rem;
-        border-radius: 10px;
-        color: white;
-    }
-    .entity-tag {
-        display: inline-block;
-        padding: 4px 12px;
-        margin: 4px;
-        background: #e3f2fd;
-        border-radius: 16px;
-        font-size: 0.85rem;
-    }
-    .doc-card {
-        border: 1px solid #ddd;
-        border-radius: 10px;
-        padding: 1rem;
-        margin-bottom: 1rem;
-        background: #fafafa;
-    }
-    .success-box {
-        background-color: #d4edda;
-        border: 1px solid #c3e6cb;
-        padding: 1rem;
-        border-radius: 8px;
-        margin: 1rem 0;
-    }
-    .warning-box {
-        background-color: #fff3cd;
-        border: 1px solid #ffeeba;
-        padding: 1rem;
-        border-radius: 8px;
-        margin: 1rem 0;
-    }
-</style>
-""", unsafe_allow_html=True)
+
+@st.cache_data
+def load_css() -> str:
+    """Read the app stylesheet once per process"""
+    return (ASSETS_DIR / "style.css").read_text(encoding="utf-8")
+
+
+# Custom CSS for better UI (re-emitted each run; Streamlit drops elements a rerun skips)
+st.markdown(f"<style>{load_css()}</style>", unsafe_allow_html=True)
+
+
+@st.cache_resource(show_spinner="Loading embedding model...")
+def load_rag_engine():
+    """Create the RAG engine and warm up its embedding model once per process"""
+    rag_engine = get_rag_engine()
+    rag_engine.warmup()
+    return rag_engine
+
+
+@st.cache_resource
+def get_processing_pool() -> ThreadPoolExecutor:
+    """Worker threads that run the upload pipeline off the UI thread"""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="doc-processing")
 
 
 def process_uploaded_file(uploaded_file) -> dict:
@@ -91,44 +77,32 @@ def process_uploaded_file(uploaded_file) -> dict:
     # Generate unique ID
     doc_id = str(uuid.uuid4())
     
-    # Save file to disk
-    file_path = DOCUMENTS_DIR / uploaded_file.name
+    # Save file to disk in 1 MB blocks (prefixed with the ID so concurrent
+    # uploads of the same filename never share a path)
+    file_path = DOCUMENTS_DIR / f"{doc_id}_{uploaded_file.name}"
+    uploaded_file.seek(0)
     with open(file_path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
+        shutil.copyfileobj(uploaded_file, f, 1024 * 1024)
     
     # Extract text
     text = extract_text(str(file_path))
+    doc = DocumentContext(text)
     
     # Classify document
-    doc_type = classify_document(text)
+    doc_type = classify_document(doc)
     
     # Extract entities
-    entities = extract_entities(text)
+    entities = doc.entities
     entity_summary = get_entity_summary(entities)
     
     # Calculate quality score
-    quality_score = calculate_quality_score(text, doc_type)
+    quality_score = calculate_quality_score(text, doc_type, entities=entities)
     
     # Get document stats
-    stats = get_document_stats(text)
+    stats = get_document_stats(text, words=doc.words)
     
     # Chunk text for RAG
-    chunks = chunk_text(text)
-    
-    # Save to SQLite
-    save_document(
-        doc_id=doc_id,
-        filename=uploaded_file.name,
-        file_path=str(file_path),
-        file_size=uploaded_file.size,
-        doc_type=doc_type,
-        extracted_text=text,
-        quality_score=quality_score,
-        metadata={**stats, 'entity_count': entity_summary['total_entities']}
-    )
-    
-    # Save entities
-    save_entities(doc_id, entities)
+    chunks = chunk_text(text, words=doc.words)
     
     # Add to vector database
     rag_engine = get_rag_engine()
@@ -142,8 +116,23 @@ def process_uploaded_file(uploaded_file) -> dict:
         }
     )
     
-    # Save chunk references
-    save_chunks(doc_id, chunks, embedding_ids)
+    # Save document, entities and chunk references to SQLite in one transaction
+    saved = save_document_bundle(
+        doc_id=doc_id,
+        filename=uploaded_file.name,
+        file_path=str(file_path),
+        file_size=uploaded_file.size,
+        doc_type=doc_type,
+        extracted_text=text,
+        quality_score=quality_score,
+        metadata={**stats, 'entity_count': entity_summary['total_entities']},
+        entities=entities,
+        chunks=chunks,
+        embedding_ids=embedding_ids
+    )
+    if not saved:
+        rag_engine.delete_document_embeddings(doc_id)
+        raise Exception("Failed to save document to the database")
     
     return {
         'doc_id': doc_id,
@@ -157,6 +146,29 @@ def process_uploaded_file(uploaded_file) -> dict:
     }
 
 
+@st.fragment(run_every=0.5)
+def render_processing_status():
+    """Show uploads still processing and rerun the app once any of them finishes"""
+    pending = st.session_state['pending_uploads']
+    finished = [item for item in pending if item[1].done()]
+    
+    if not finished:
+        for filename, _ in pending:
+            st.info(f"⏳ Processing {filename}...")
+        return
+    
+    for item in finished:
+        filename, future = item
+        pending.remove(item)
+        try:
+            st.session_state['last_processed'] = future.result()
+            st.toast(f"✅ {filename} processed!")
+        except Exception as e:
+            st.session_state.setdefault('upload_errors', []).append(f"{filename}: {str(e)}")
+    
+    st.rerun()
+
+
 def render_sidebar():
     """Render the sidebar with upload and navigation"""
     
@@ -172,15 +184,21 @@ def render_sidebar():
         if uploaded_file:
             st.info(f"📄 {uploaded_file.name} ({uploaded_file.size / 1024:.1f} KB)")
             
-            if st.button("🚀 Process Document", type="primary", use_container_width=True):
-                with st.spinner("Processing..."):
-                    try:
-                        result = process_uploaded_file(uploaded_file)
-                        st.session_state['last_processed'] = result
-                        st.success("✅ Document processed!")
-                        st.rerun()
-                    except Exception as e:
-                        st.error(f"Error: {str(e)}")
+            pending = st.session_state.setdefault('pending_uploads', [])
+            is_pending = any(filename == uploaded_file.name for filename, _ in pending)
+            
+            # Disabled while this file is processing so repeat clicks don't queue duplicates
+            if st.button("🚀 Process Document", type="primary", use_container_width=True,
+                         disabled=is_pending) and not is_pending:
+                future = get_processing_pool().submit(process_uploaded_file, uploaded_file)
+                pending.append((uploaded_file.name, future))
+                st.rerun()
+        
+        for error in st.session_state.pop('upload_errors', []):
+            st.error(f"Error: {error}")
+        
+        if st.session_state.get('pending_uploads'):
+            render_processing_status()
         
         st.markdown("---")
         
@@ -254,21 +272,17 @@ def render_chat_page():
     with st.expander("🔧 Search Options"):
         filter_type = st.selectbox(
             "Filter by document type",
-            ["All Types", "Loan Application", "KYC Document", "Bank Statement", "Salary Slip", "Other"]
+            list(DOC_TYPE_FILTERS)
         )
         top_k = st.slider("Number of results", 1, 10, 5)
     
     # Process query
     if search_btn and query:
-        filter_value = None
-        if filter_type != "All Types":
-            filter_value = filter_type.lower().replace(' ', '_')
-        
         with st.spinner("Searching..."):
             result = rag_engine.query(
                 question=query,
                 top_k=top_k,
-                filter_doc_type=filter_value
+                filter_doc_type=DOC_TYPE_FILTERS[filter_type]
             )
         
         # Display answer
@@ -316,7 +330,7 @@ def render_documents_page():
     st.markdown('<p class="main-header">📚 Documents</p>', unsafe_allow_html=True)
     st.markdown('<p class="sub-header">View and manage uploaded documents</p>', unsafe_allow_html=True)
     
-    documents = get_all_documents()
+    documents = get_all_documents_summary()
     
     if not documents:
         st.info("No documents uploaded yet. Use the sidebar to upload your first document!")
@@ -351,9 +365,10 @@ def render_documents_page():
                     st.markdown(f"- {etype.replace('_', ' ').title()}: `{', '.join(values[:3])}`{'...' if len(values) > 3 else ''}")
             
             # Show text preview
-            if doc['extracted_text']:
+            preview = get_document_preview(doc['id'])
+            if preview:
                 st.markdown("**Text Preview:**")
-                st.text(doc['extracted_text'][:500] + "..." if len(doc['extracted_text']) > 500 else doc['extracted_text'])
+                st.text(preview)
             
             # Delete button
             if st.button("🗑️ Delete", key=f"delete_{doc['id']}"):
@@ -416,7 +431,7 @@ def render_dashboard_page():
     
     # Recent documents
     st.markdown("### 📋 Recent Documents")
-    documents = get_all_documents()[:5]
+    documents = get_all_documents_summary()[:5]
     
     if documents:
         for doc in documents:
@@ -431,6 +446,9 @@ def render_dashboard_page():
 def main():
     """Main application entry point"""
     
+    # Load the embedding model before the first user action needs it
+    load_rag_engine()
+    
     # Render sidebar and get current page
     page = render_sidebar()
     
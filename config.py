@@ -10,10 +10,14 @@ DATA_DIR = BASE_DIR / "data"
 DOCUMENTS_DIR = DATA_DIR / "documents"
 CHROMA_DIR = DATA_DIR / "chroma_db"
 SAMPLE_DOCS_DIR = BASE_DIR / "sample_docs"
+ASSETS_DIR = BASE_DIR / "assets"
 
 # Database
 DATABASE_PATH = DATA_DIR / "banking.db"
 
+# On-disk cache of chunk embeddings, keyed by chunk content
+EMBEDDING_CACHE_PATH = DATA_DIR / "embedding_cache.db"
+
 # Ensure directories exist
 DOCUMENTS_DIR.mkdir(parents=True, exist_ok=True)
 CHROMA_DIR.mkdir(parents=True, exist_ok=True)
@@ -21,15 +25,31 @@ SAMPLE_DOCS_DIR.mkdir(parents=True, exist_ok=True)
 
 # Embedding model (free, runs locally)
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_MAX_SEQ_LENGTH = 256  # tokens; chunks are ~500 characters
+EMBEDDING_INT8_ON_CPU = True  # int8 dynamic quantization when no GPU (FP16 on CUDA)
+
+# Vector index (ChromaDB HNSW) settings, applied when the collection is created
+HNSW_SPACE = "cosine"
+HNSW_M = 24
+HNSW_CONSTRUCTION_EF = 128
+HNSW_SEARCH_EF = 80
 
 # Ollama settings (local LLM)
 OLLAMA_MODEL = "llama3:8b"  # or "phi3:mini" for lower RAM usage
 OLLAMA_HOST = "http://localhost:11434"
+OLLAMA_CHECK_TTL = 30  # seconds before re-probing whether Ollama is running
 
 # Chunking settings
 CHUNK_SIZE = 500
 CHUNK_OVERLAP = 50
 
+# PDFs up to this size are read into memory before parsing
+PDF_IN_MEMORY_MAX_BYTES = 50 * 1024 * 1024
+
+# PDFs with at least this many pages are split across worker processes
+PDF_PARALLEL_MIN_PAGES = 48
+PDF_MAX_WORKERS = 4
+
 # Document types
 DOCUMENT_TYPES = [
     "loan_application",
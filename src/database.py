@@ -4,20 +4,46 @@ SQLite-based storage for document metadata and extracted entities
 Zero setup required - SQLite is built into Python
 """
 import sqlite3
-import json
+import threading
+import uuid
 from datetime import datetime
 from pathlib import Path
 from typing import List, Dict, Optional
 
+import orjson
+import zstandard as zstd
+
 import sys
 sys.path.append(str(Path(__file__).parent.parent))
 from config import DATABASE_PATH
 
 
+# One connection per thread, reused across calls
+_local = threading.local()
+
+# Statistics are recomputed only after a write bumps the version
+_stats_version = 0
+_stats_cache = {'version': None, 'stats': None}
+
+
+def _invalidate_statistics():
+    """Mark cached statistics as stale after a write"""
+    global _stats_version
+    _stats_version += 1
+
+
 def get_connection():
-    """Get a database connection with row factory"""
-    conn = sqlite3.connect(str(DATABASE_PATH))
-    conn.row_factory = sqlite3.Row
+    """Get this thread's database connection with row factory"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(str(DATABASE_PATH))
+        conn.row_factory = sqlite3.Row
+        # Per-connection tuning (journal_mode is set once in init_database)
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA mmap_size=268435456')
+        conn.execute('PRAGMA cache_size=-20000')
+        _local.conn = conn
     return conn
 
 
@@ -26,10 +52,13 @@ def init_database():
     conn = get_connection()
     cursor = conn.cursor()
     
+    # WAL lets readers run alongside a writer and avoids an fsync per commit
+    cursor.execute('PRAGMA journal_mode=WAL')
+    
     # Documents table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS documents (
-            id TEXT PRIMARY KEY,
+            id BLOB PRIMARY KEY,
             filename TEXT NOT NULL,
             file_path TEXT NOT NULL,
             file_size INTEGER,
@@ -37,7 +66,7 @@ def init_database():
             upload_date TEXT,
             processed_date TEXT,
             status TEXT DEFAULT 'pending',
-            extracted_text TEXT,
+            extracted_text BLOB,
             quality_score REAL,
             metadata TEXT
         )
@@ -47,7 +76,7 @@ def init_database():
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS entities (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            document_id TEXT,
+            document_id BLOB,
             entity_type TEXT,
             entity_value TEXT,
             is_valid INTEGER DEFAULT 1,
@@ -60,7 +89,7 @@ def init_database():
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS document_chunks (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            document_id TEXT,
+            document_id BLOB,
             chunk_index INTEGER,
             chunk_text TEXT,
             embedding_id TEXT,
@@ -81,8 +110,166 @@ def init_database():
         )
     ''')
     
+    # Document IDs used to be stored as UUID text; convert them to 16-byte blobs
+    _migrate_text_ids(cursor)
+    
+    # Indexes for per-document lookups and document listings
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_entities_doc ON entities(document_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_chunks_doc ON document_chunks(document_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_documents_type ON documents(doc_type)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_documents_upload ON documents(upload_date DESC)')
+    
+    # Full-text index over document text. Contentless because extracted_text
+    # is stored compressed: rows are indexed from Python with the plain text
+    # instead of via triggers. FTS rowids come from documents_fts_ids, whose
+    # explicit INTEGER PRIMARY KEY (unlike documents' implicit rowid) is
+    # never renumbered by VACUUM.
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'documents_fts_ids'")
+    fts_ready = cursor.fetchone() is not None
+    if not fts_ready:
+        # Older indexes were keyed on documents.rowid; rebuild from scratch
+        cursor.execute('DROP TABLE IF EXISTS documents_fts')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS documents_fts_ids (
+            fts_rowid INTEGER PRIMARY KEY,
+            document_id BLOB UNIQUE NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts
+        USING fts5(extracted_text, content='')
+    ''')
+    if not fts_ready:
+        cursor.execute('INSERT INTO documents_fts_ids (document_id) SELECT id FROM documents')
+        cursor.execute('''
+            SELECT m.fts_rowid, d.extracted_text
+            FROM documents_fts_ids m
+            JOIN documents d ON d.id = m.document_id
+        ''')
+        cursor.executemany(
+            'INSERT INTO documents_fts (rowid, extracted_text) VALUES (?, ?)',
+            [(row['fts_rowid'], _decompress_text(row['extracted_text'])) for row in cursor.fetchall()]
+        )
+    
     conn.commit()
-    conn.close()
+
+
+def _migrate_text_ids(cursor):
+    """Convert UUID text IDs left by older versions to their blob form"""
+    cursor.execute("SELECT id FROM documents WHERE typeof(id) = 'text'")
+    pairs = [(_id_to_db(row['id']), row['id']) for row in cursor.fetchall()]
+    pairs = [(new_id, old_id) for new_id, old_id in pairs if new_id != old_id]
+    
+    if pairs:
+        cursor.executemany('UPDATE documents SET id = ? WHERE id = ?', pairs)
+        cursor.executemany('UPDATE entities SET document_id = ? WHERE document_id = ?', pairs)
+        cursor.executemany('UPDATE document_chunks SET document_id = ? WHERE document_id = ?', pairs)
+
+
+def _id_to_db(doc_id: str):
+    """Convert a UUID string to its 16-byte storage form (other IDs stay text)"""
+    try:
+        return uuid.UUID(doc_id).bytes
+    except ValueError:
+        return doc_id
+
+
+def _id_from_db(value) -> str:
+    """Convert a stored document ID back to its UUID string"""
+    if isinstance(value, bytes):
+        return str(uuid.UUID(bytes=value))
+    return value
+
+
+def _compress_text(text: Optional[str]) -> Optional[bytes]:
+    """Compress document text for storage"""
+    if text is None:
+        return None
+    return zstd.compress(text.encode('utf-8'), 3)
+
+
+def _decompress_text(value) -> Optional[str]:
+    """Decompress stored document text (legacy rows hold plain TEXT)"""
+    if isinstance(value, bytes):
+        return zstd.decompress(value).decode('utf-8')
+    return value
+
+
+def _document_from_row(row) -> Dict:
+    """Convert a documents row to a dict with readable extracted text"""
+    doc = dict(row)
+    doc['id'] = _id_from_db(doc['id'])
+    doc['extracted_text'] = _decompress_text(doc['extracted_text'])
+    return doc
+
+
+def _insert_document(
+    cursor,
+    doc_id: str,
+    filename: str,
+    file_path: str,
+    file_size: int,
+    doc_type: str,
+    extracted_text: str,
+    quality_score: float,
+    metadata: dict,
+    now: str
+):
+    """Insert a documents row using an existing cursor"""
+    cursor.execute('''
+        INSERT INTO documents 
+        (id, filename, file_path, file_size, doc_type, upload_date, 
+         processed_date, status, extracted_text, quality_score, metadata)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        _id_to_db(doc_id),
+        filename,
+        file_path,
+        file_size,
+        doc_type,
+        now,
+        now,
+        'completed',
+        _compress_text(extracted_text),
+        quality_score,
+        orjson.dumps(metadata).decode() if metadata else None
+    ))
+    cursor.execute(
+        'INSERT INTO documents_fts_ids (document_id) VALUES (?)',
+        (_id_to_db(doc_id),)
+    )
+    cursor.execute(
+        'INSERT INTO documents_fts (rowid, extracted_text) VALUES (?, ?)',
+        (cursor.lastrowid, extracted_text)
+    )
+
+
+def _insert_entities(cursor, doc_id: str, entities: Dict[str, List[str]], now: str):
+    """Insert entity rows using an existing cursor"""
+    doc_key = _id_to_db(doc_id)
+    rows = [
+        (doc_key, entity_type, value, now)
+        for entity_type, values in entities.items()
+        for value in values
+    ]
+    cursor.executemany('''
+        INSERT INTO entities (document_id, entity_type, entity_value, created_at)
+        VALUES (?, ?, ?, ?)
+    ''', rows)
+
+
+def _insert_chunks(cursor, doc_id: str, chunks: List[tuple], embedding_ids: List[str], now: str):
+    """Insert chunk rows using an existing cursor"""
+    doc_key = _id_to_db(doc_id)
+    rows = [
+        (doc_key, chunk_index, chunk_text, embedding_id, now)
+        for (chunk_text, chunk_index), embedding_id in zip(chunks, embedding_ids)
+    ]
+    cursor.executemany('''
+        INSERT INTO document_chunks 
+        (document_id, chunk_index, chunk_text, embedding_id, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', rows)
 
 
 def save_document(
@@ -105,31 +292,18 @@ def save_document(
     cursor = conn.cursor()
     
     try:
-        cursor.execute('''
-            INSERT INTO documents 
-            (id, filename, file_path, file_size, doc_type, upload_date, 
-             processed_date, status, extracted_text, quality_score, metadata)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            doc_id,
-            filename,
-            file_path,
-            file_size,
-            doc_type,
-            datetime.now().isoformat(),
-            datetime.now().isoformat(),
-            'completed',
-            extracted_text,
-            quality_score,
-            json.dumps(metadata) if metadata else None
-        ))
+        _insert_document(
+            cursor, doc_id, filename, file_path, file_size,
+            doc_type, extracted_text, quality_score, metadata,
+            datetime.now().isoformat()
+        )
         conn.commit()
+        _invalidate_statistics()
         return True
     except Exception as e:
+        conn.rollback()
         print(f"Error saving document: {e}")
         return False
-    finally:
-        conn.close()
 
 
 def save_entities(doc_id: str, entities: Dict[str, List[str]]) -> bool:
@@ -144,20 +318,15 @@ def save_entities(doc_id: str, entities: Dict[str, List[str]]) -> bool:
     cursor = conn.cursor()
     
     try:
-        for entity_type, values in entities.items():
-            for value in values:
-                cursor.execute('''
-                    INSERT INTO entities (document_id, entity_type, entity_value, created_at)
-                    VALUES (?, ?, ?, ?)
-                ''', (doc_id, entity_type, value, datetime.now().isoformat()))
-        
+        cursor.execute('BEGIN IMMEDIATE')
+        _insert_entities(cursor, doc_id, entities, datetime.now().isoformat())
         conn.commit()
+        _invalidate_statistics()
         return True
     except Exception as e:
+        conn.rollback()
         print(f"Error saving entities: {e}")
         return False
-    finally:
-        conn.close()
 
 
 def save_chunks(doc_id: str, chunks: List[tuple], embedding_ids: List[str]) -> bool:
@@ -173,20 +342,59 @@ def save_chunks(doc_id: str, chunks: List[tuple], embedding_ids: List[str]) -> b
     cursor = conn.cursor()
     
     try:
-        for (chunk_text, chunk_index), embedding_id in zip(chunks, embedding_ids):
-            cursor.execute('''
-                INSERT INTO document_chunks 
-                (document_id, chunk_index, chunk_text, embedding_id, created_at)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (doc_id, chunk_index, chunk_text, embedding_id, datetime.now().isoformat()))
-        
+        cursor.execute('BEGIN IMMEDIATE')
+        _insert_chunks(cursor, doc_id, chunks, embedding_ids, datetime.now().isoformat())
         conn.commit()
         return True
     except Exception as e:
+        conn.rollback()
         print(f"Error saving chunks: {e}")
         return False
-    finally:
-        conn.close()
+
+
+def save_document_bundle(
+    doc_id: str,
+    filename: str,
+    file_path: str,
+    file_size: int,
+    doc_type: str,
+    extracted_text: str,
+    quality_score: float,
+    metadata: dict,
+    entities: Dict[str, List[str]],
+    chunks: List[tuple],
+    embedding_ids: List[str]
+) -> bool:
+    """
+    Save a document with its entities and chunks in one transaction
+    
+    Args:
+        entities: Dictionary of entity_type -> list of values
+        chunks: List of (chunk_text, chunk_index) tuples
+        embedding_ids: List of embedding IDs from vector DB
+        
+    Returns:
+        True if successful, False otherwise (nothing is written)
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    try:
+        now = datetime.now().isoformat()
+        cursor.execute('BEGIN IMMEDIATE')
+        _insert_document(
+            cursor, doc_id, filename, file_path, file_size,
+            doc_type, extracted_text, quality_score, metadata, now
+        )
+        _insert_entities(cursor, doc_id, entities, now)
+        _insert_chunks(cursor, doc_id, chunks, embedding_ids, now)
+        conn.commit()
+        _invalidate_statistics()
+        return True
+    except Exception as e:
+        conn.rollback()
+        print(f"Error saving document bundle: {e}")
+        return False
 
 
 def get_document(doc_id: str) -> Optional[Dict]:
@@ -194,12 +402,11 @@ def get_document(doc_id: str) -> Optional[Dict]:
     conn = get_connection()
     cursor = conn.cursor()
     
-    cursor.execute('SELECT * FROM documents WHERE id = ?', (doc_id,))
+    cursor.execute('SELECT * FROM documents WHERE id = ?', (_id_to_db(doc_id),))
     row = cursor.fetchone()
-    conn.close()
     
     if row:
-        return dict(row)
+        return _document_from_row(row)
     return None
 
 
@@ -210,9 +417,53 @@ def get_all_documents() -> List[Dict]:
     
     cursor.execute('SELECT * FROM documents ORDER BY upload_date DESC')
     rows = cursor.fetchall()
-    conn.close()
     
-    return [dict(row) for row in rows]
+    return [_document_from_row(row) for row in rows]
+
+
+def get_all_documents_summary() -> List[Dict]:
+    """Get all documents without the extracted text, for list views"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        SELECT id, filename, file_path, file_size, doc_type, upload_date, quality_score
+        FROM documents
+        ORDER BY upload_date DESC
+    ''')
+    rows = cursor.fetchall()
+    
+    return [{**dict(row), 'id': _id_from_db(row['id'])} for row in rows]
+
+
+def get_document_preview(doc_id: str, max_chars: int = 500) -> Optional[str]:
+    """
+    Get the start of a document's extracted text
+    
+    Args:
+        doc_id: Document ID
+        max_chars: Preview length; longer texts are cut and end with "..."
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute('SELECT extracted_text FROM documents WHERE id = ?', (_id_to_db(doc_id),))
+    row = cursor.fetchone()
+    
+    if not row or not row['extracted_text']:
+        return None
+    
+    # Read one extra character to know whether the text was cut
+    value = row['extracted_text']
+    if isinstance(value, bytes):
+        # Only decompress the leading bytes (UTF-8 is at most 4 bytes per char)
+        with zstd.ZstdDecompressor().stream_reader(value) as reader:
+            head = reader.read((max_chars + 1) * 4)
+        preview = head.decode('utf-8', errors='ignore')[:max_chars + 1]
+    else:
+        preview = value[:max_chars + 1]
+    
+    return preview[:max_chars] + "..." if len(preview) > max_chars else preview
 
 
 def get_document_entities(doc_id: str) -> Dict[str, List[str]]:
@@ -224,10 +475,9 @@ def get_document_entities(doc_id: str) -> Dict[str, List[str]]:
         SELECT entity_type, entity_value 
         FROM entities 
         WHERE document_id = ?
-    ''', (doc_id,))
+    ''', (_id_to_db(doc_id),))
     
     rows = cursor.fetchall()
-    conn.close()
     
     entities = {}
     for row in rows:
@@ -246,9 +496,8 @@ def get_documents_by_type(doc_type: str) -> List[Dict]:
     
     cursor.execute('SELECT * FROM documents WHERE doc_type = ?', (doc_type,))
     rows = cursor.fetchall()
-    conn.close()
     
-    return [dict(row) for row in rows]
+    return [_document_from_row(row) for row in rows]
 
 
 def search_entities(entity_type: str = None, value_pattern: str = None) -> List[Dict]:
@@ -275,9 +524,40 @@ def search_entities(entity_type: str = None, value_pattern: str = None) -> List[
     
     cursor.execute(query, params)
     rows = cursor.fetchall()
-    conn.close()
     
-    return [dict(row) for row in rows]
+    return [{**dict(row), 'document_id': _id_from_db(row['document_id'])} for row in rows]
+
+
+def search_text(query: str, limit: int = 20) -> List[str]:
+    """
+    Full-text search over document text
+    
+    Args:
+        query: Words to search for (all must appear)
+        limit: Maximum number of document IDs to return
+        
+    Returns:
+        Matching document IDs, best match first
+    """
+    # Quote each word so user input is never parsed as FTS5 query syntax
+    terms = ' '.join('"' + word.replace('"', '""') + '"' for word in query.split())
+    if not terms:
+        return []
+    
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        SELECT m.document_id
+        FROM documents_fts f
+        JOIN documents_fts_ids m ON m.fts_rowid = f.rowid
+        WHERE documents_fts MATCH ?
+        ORDER BY f.rank
+        LIMIT ?
+    ''', (terms, limit))
+    rows = cursor.fetchall()
+    
+    return [_id_from_db(row['document_id']) for row in rows]
 
 
 def log_query(query_text: str, response_text: str, sources: List[str], execution_time_ms: int):
@@ -288,41 +568,45 @@ def log_query(query_text: str, response_text: str, sources: List[str], execution
     cursor.execute('''
         INSERT INTO query_logs (query_text, response_text, sources, execution_time_ms, created_at)
         VALUES (?, ?, ?, ?, ?)
-    ''', (query_text, response_text, json.dumps(sources), execution_time_ms, datetime.now().isoformat()))
+    ''', (query_text, response_text, orjson.dumps(sources).decode(), execution_time_ms, datetime.now().isoformat()))
     
     conn.commit()
-    conn.close()
+    _invalidate_statistics()
 
 
 def get_statistics() -> Dict:
-    """Get database statistics for dashboard"""
+    """Get database statistics for dashboard (cached until the next write)"""
+    version = _stats_version
+    if _stats_cache['version'] == version:
+        return _stats_cache['stats']
+    
     conn = get_connection()
     cursor = conn.cursor()
     
-    stats = {}
-    
-    # Total documents
-    cursor.execute('SELECT COUNT(*) as count FROM documents')
-    stats['total_documents'] = cursor.fetchone()['count']
+    # Scalar aggregates in a single round trip
+    cursor.execute('''
+        SELECT
+            (SELECT COUNT(*) FROM documents) AS total_documents,
+            (SELECT AVG(quality_score) FROM documents) AS avg_score,
+            (SELECT COUNT(*) FROM entities) AS total_entities,
+            (SELECT COUNT(*) FROM query_logs) AS total_queries
+    ''')
+    totals = cursor.fetchone()
     
     # Documents by type
     cursor.execute('SELECT doc_type, COUNT(*) as count FROM documents GROUP BY doc_type')
-    stats['by_type'] = {row['doc_type']: row['count'] for row in cursor.fetchall()}
-    
-    # Average quality score
-    cursor.execute('SELECT AVG(quality_score) as avg_score FROM documents')
-    result = cursor.fetchone()
-    stats['avg_quality_score'] = round(result['avg_score'], 2) if result['avg_score'] else 0
-    
-    # Total entities
-    cursor.execute('SELECT COUNT(*) as count FROM entities')
-    stats['total_entities'] = cursor.fetchone()['count']
-    
-    # Total queries
-    cursor.execute('SELECT COUNT(*) as count FROM query_logs')
-    stats['total_queries'] = cursor.fetchone()['count']
-    
-    conn.close()
+    by_type = {row['doc_type']: row['count'] for row in cursor.fetchall()}
+    
+    stats = {
+        'total_documents': totals['total_documents'],
+        'by_type': by_type,
+        'avg_quality_score': round(totals['avg_score'], 2) if totals['avg_score'] else 0,
+        'total_entities': totals['total_entities'],
+        'total_queries': totals['total_queries'],
+    }
+    
+    _stats_cache['version'] = version
+    _stats_cache['stats'] = stats
     return stats
 
 
@@ -332,16 +616,33 @@ def delete_document(doc_id: str) -> bool:
     cursor = conn.cursor()
     
     try:
-        cursor.execute('DELETE FROM entities WHERE document_id = ?', (doc_id,))
-        cursor.execute('DELETE FROM document_chunks WHERE document_id = ?', (doc_id,))
-        cursor.execute('DELETE FROM documents WHERE id = ?', (doc_id,))
+        doc_key = _id_to_db(doc_id)
+        
+        # Contentless FTS rows are removed by replaying the indexed text
+        cursor.execute('''
+            SELECT m.fts_rowid, d.extracted_text
+            FROM documents d
+            JOIN documents_fts_ids m ON m.document_id = d.id
+            WHERE d.id = ?
+        ''', (doc_key,))
+        row = cursor.fetchone()
+        if row:
+            cursor.execute(
+                "INSERT INTO documents_fts (documents_fts, rowid, extracted_text) VALUES ('delete', ?, ?)",
+                (row['fts_rowid'], _decompress_text(row['extracted_text']))
+            )
+        cursor.execute('DELETE FROM documents_fts_ids WHERE document_id = ?', (doc_key,))
+        
+        cursor.execute('DELETE FROM entities WHERE document_id = ?', (doc_key,))
+        cursor.execute('DELETE FROM document_chunks WHERE document_id = ?', (doc_key,))
+        cursor.execute('DELETE FROM documents WHERE id = ?', (doc_key,))
         conn.commit()
+        _invalidate_statistics()
         return True
     except Exception as e:
+        conn.rollback()
         print(f"Error deleting document: {e}")
         return False
-    finally:
-        conn.close()
 
 
 # Initialize database on module import
@@ -3,39 +3,226 @@ Document Processing Module
 Handles PDF extraction, text processing, and document classification
 All operations are free and local - no paid APIs
 """
+import multiprocessing
+import operator
+import os
 import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from functools import cached_property
 from pathlib import Path
-from typing import List, Tuple
-import PyPDF2
+from typing import Dict, List, Tuple
+import ahocorasick
+import pypdfium2 as pdfium
 
 import sys
 sys.path.append(str(Path(__file__).parent.parent))
-from config import CHUNK_SIZE, CHUNK_OVERLAP
+from config import (
+    CHUNK_SIZE, CHUNK_OVERLAP, PDF_IN_MEMORY_MAX_BYTES,
+    PDF_PARALLEL_MIN_PAGES, PDF_MAX_WORKERS
+)
+from src.entity_extractor import extract_entities
 
+# Sentence-ending punctuation used for sentence counts
+SENTENCE_END_PATTERN = re.compile(r'[.!?]+')
 
-def extract_text_from_pdf(file_path: str) -> str:
+# Keywords for each document type
+DOCUMENT_KEYWORDS = {
+    'loan_application': [
+        'loan application', 'loan amount', 'emi', 'interest rate',
+        'home loan', 'personal loan', 'business loan', 'loan tenure',
+        'principal amount', 'loan purpose', 'collateral'
+    ],
+    'kyc_document': [
+        'aadhaar', 'aadhar', 'pan card', 'kyc', 'know your customer',
+        'identity proof', 'address proof', 'passport', 'voter id',
+        'driving license', 'verification', 'identity document'
+    ],
+    'bank_statement': [
+        'account statement', 'transaction history', 'opening balance',
+        'closing balance', 'credit', 'debit', 'statement period',
+        'account number', 'transaction date', 'bank statement'
+    ],
+    'salary_slip': [
+        'salary slip', 'pay slip', 'gross salary', 'net salary',
+        'basic pay', 'allowances', 'deductions', 'pf contribution',
+        'income tax', 'take home', 'earnings'
+    ]
+}
+
+
+def _build_keyword_automaton() -> ahocorasick.Automaton:
+    """Build an Aho-Corasick automaton over all classification keywords"""
+    automaton = ahocorasick.Automaton()
+    for keywords in DOCUMENT_KEYWORDS.values():
+        for keyword in keywords:
+            automaton.add_word(keyword, keyword)
+    automaton.make_automaton()
+    return automaton
+
+
+KEYWORD_AUTOMATON = _build_keyword_automaton()
+
+# Sort key for (doc_type, score) pairs
+_SCORE = operator.itemgetter(1)
+
+
+@dataclass
+class DocumentContext:
+    """Extracted document text plus derived values, computed once and shared"""
+    text: str
+    
+    @cached_property
+    def text_lower(self) -> str:
+        """Lowercased text for case-insensitive matching"""
+        return self.text.lower()
+    
+    @cached_property
+    def words(self) -> List[str]:
+        """Whitespace-separated words of the text"""
+        return self.text.split()
+    
+    @cached_property
+    def entities(self) -> Dict[str, List[str]]:
+        """Entities extracted from the text"""
+        return extract_entities(self.text)
+
+
+# PDFium is not thread-safe, even across documents, and uploads are
+# processed on worker threads: every in-process PDFium call holds this lock
+_pdfium_lock = threading.Lock()
+
+# Worker processes for large PDFs, created on first use
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    """Get the shared process pool used for page extraction"""
+    global _pdf_pool
+    if _pdf_pool is None:
+        with _pdf_pool_lock:
+            if _pdf_pool is None:
+                # spawn: PDFium state must not be inherited from a threaded parent
+                _pdf_pool = ProcessPoolExecutor(
+                    max_workers=_pdf_worker_count(),
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+    return _pdf_pool
+
+
+def _discard_pdf_pool(pool: ProcessPoolExecutor):
+    """Drop a broken pool so the next call starts a fresh one"""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is pool:
+            _pdf_pool = None
+    pool.shutdown(wait=False)
+
+
+def _pdf_worker_count() -> int:
+    """Number of processes to extract pages with"""
+    return max(1, min(PDF_MAX_WORKERS, os.cpu_count() or 1))
+
+
+def _read_pdf_source(file_path: str):
+    """Small files are read in one go so PDFium parses from memory"""
+    if Path(file_path).stat().st_size <= PDF_IN_MEMORY_MAX_BYTES:
+        with open(file_path, 'rb') as file:
+            return file.read()
+    return file_path
+
+
+def _extract_pdf_pages(pdf, start: int, stop: int) -> List[str]:
+    """Extract the text of pages start..stop-1 from an open PDF"""
+    texts = []
+    for page_num in range(start, stop):
+        page = pdf[page_num]
+        textpage = page.get_textpage()
+        # PDFium separates lines with CRLF
+        texts.append(textpage.get_text_range().replace('\r\n', '\n'))
+        textpage.close()
+        page.close()
+    return texts
+
+
+def _extract_pdf_page_range(args: Tuple[str, int, int]) -> List[str]:
+    """Process pool worker: open the PDF and extract one range of pages"""
+    file_path, start, stop = args
+    pdf = pdfium.PdfDocument(_read_pdf_source(file_path))
+    try:
+        return _extract_pdf_pages(pdf, start, stop)
+    finally:
+        pdf.close()
+
+
+def _extract_pdf_in_pool(file_path: str, page_count: int, workers: int) -> List[str]:
+    """Extract contiguous page ranges in worker processes, keeping page order"""
+    step = -(-page_count // workers)
+    ranges = [
+        (str(file_path), start, min(start + step, page_count))
+        for start in range(0, page_count, step)
+    ]
+    
+    for attempt in range(2):
+        pool = _get_pdf_pool()
+        try:
+            return [
+                text
+                for texts in pool.map(_extract_pdf_page_range, ranges)
+                for text in texts
+            ]
+        except BrokenProcessPool:
+            # A worker died (e.g. PDFium crashed on a malformed file). Replace
+            # the pool and retry once; if this file kills it again, fail it
+            # rather than crash the server by extracting in-process
+            _discard_pdf_pool(pool)
+            if attempt:
+                raise
+            print("PDF worker pool broke, retrying on a fresh pool")
+
+
+def extract_text_from_pdf(file_path: str, include_page_markers: bool = True) -> str:
     """
-    Extract text from a PDF file using PyPDF2 (free, local)
+    Extract text from a PDF file using pypdfium2 (free, local)
     
     Args:
         file_path: Path to the PDF file
+        include_page_markers: Prefix each page with a "--- Page N ---" line
         
     Returns:
         Extracted text as a string
     """
-    text = ""
     try:
-        with open(file_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            for page_num, page in enumerate(reader.pages):
-                page_text = page.extract_text()
-                if page_text:
-                    text += f"\n--- Page {page_num + 1} ---\n"
-                    text += page_text
+        source = _read_pdf_source(file_path)
+        workers = _pdf_worker_count()
+        page_texts = None
+        with _pdfium_lock:
+            pdf = pdfium.PdfDocument(source)
+            try:
+                page_count = len(pdf)
+                if page_count < PDF_PARALLEL_MIN_PAGES or workers <= 1:
+                    page_texts = _extract_pdf_pages(pdf, 0, page_count)
+            finally:
+                pdf.close()
+        
+        if page_texts is None:
+            # The parent's handle is closed and the lock released; each worker
+            # process opens its own copy
+            page_texts = _extract_pdf_in_pool(file_path, page_count, workers)
     except Exception as e:
         raise Exception(f"Error extracting PDF: {str(e)}")
     
-    return text.strip()
+    if not include_page_markers:
+        return "\n".join(page_text for page_text in page_texts if page_text).strip()
+    
+    return "".join(
+        f"\n--- Page {page_num + 1} ---\n{page_text}"
+        for page_num, page_text in enumerate(page_texts)
+        if page_text
+    ).strip()
 
 
 def extract_text_from_txt(file_path: str) -> str:
@@ -71,12 +258,13 @@ def extract_text_from_docx(file_path: str) -> str:
         raise Exception("python-docx not installed. Run: pip install python-docx")
 
 
-def extract_text(file_path: str) -> str:
+def extract_text(file_path: str, include_page_markers: bool = True) -> str:
     """
     Extract text from any supported file type
     
     Args:
         file_path: Path to the file
+        include_page_markers: For PDFs, prefix each page with a "--- Page N ---" line
         
     Returns:
         Extracted text as a string
@@ -85,7 +273,7 @@ def extract_text(file_path: str) -> str:
     extension = path.suffix.lower()
     
     if extension == '.pdf':
-        return extract_text_from_pdf(file_path)
+        return extract_text_from_pdf(file_path, include_page_markers=include_page_markers)
     elif extension == '.txt':
         return extract_text_from_txt(file_path)
     elif extension == '.docx':
@@ -94,59 +282,37 @@ def extract_text(file_path: str) -> str:
         raise ValueError(f"Unsupported file type: {extension}")
 
 
-def classify_document(text: str) -> str:
+def classify_document(doc: DocumentContext) -> str:
     """
     Classify document type using keyword matching (free, no ML model needed)
     
     Args:
-        text: Document text content
+        doc: Document context for the text to classify
         
     Returns:
         Document type classification
     """
-    text_lower = text.lower()
-    
-    # Keywords for each document type
-    classifications = {
-        'loan_application': [
-            'loan application', 'loan amount', 'emi', 'interest rate',
-            'home loan', 'personal loan', 'business loan', 'loan tenure',
-            'principal amount', 'loan purpose', 'collateral'
-        ],
-        'kyc_document': [
-            'aadhaar', 'aadhar', 'pan card', 'kyc', 'know your customer',
-            'identity proof', 'address proof', 'passport', 'voter id',
-            'driving license', 'verification', 'identity document'
-        ],
-        'bank_statement': [
-            'account statement', 'transaction history', 'opening balance',
-            'closing balance', 'credit', 'debit', 'statement period',
-            'account number', 'transaction date', 'bank statement'
-        ],
-        'salary_slip': [
-            'salary slip', 'pay slip', 'gross salary', 'net salary',
-            'basic pay', 'allowances', 'deductions', 'pf contribution',
-            'income tax', 'take home', 'earnings'
-        ]
-    }
+    # Find every keyword present in one pass over the text
+    found = {keyword for _, keyword in KEYWORD_AUTOMATON.iter(doc.text_lower)}
     
     # Count keyword matches for each type
     scores = {}
-    for doc_type, keywords in classifications.items():
-        score = sum(1 for kw in keywords if kw in text_lower)
+    for doc_type, keywords in DOCUMENT_KEYWORDS.items():
+        score = sum(1 for kw in keywords if kw in found)
         scores[doc_type] = score
     
-    # Get the type with highest score
-    best_type = max(scores, key=scores.get)
+    # Get the type with highest score (first one wins ties)
+    best_type, best_score = max(scores.items(), key=_SCORE)
     
     # If no keywords matched, return 'other'
-    if scores[best_type] == 0:
+    if best_score == 0:
         return 'other'
     
     return best_type
 
 
-def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[Tuple[str, int]]:
+def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP,
+               words: List[str] = None) -> List[Tuple[str, int]]:
     """
     Split text into overlapping chunks for embedding
     
@@ -154,12 +320,15 @@ def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVE
         text: Text to split
         chunk_size: Maximum characters per chunk
         overlap: Number of overlapping characters between chunks
+        words: Optional precomputed text.split() result
         
     Returns:
         List of (chunk_text, chunk_index) tuples
     """
-    # Clean the text
-    text = re.sub(r'\s+', ' ', text).strip()
+    # Clean the text (collapse whitespace runs to single spaces)
+    if words is None:
+        words = text.split()
+    text = " ".join(words)
     
     if len(text) <= chunk_size:
         return [(text, 0)]
@@ -167,17 +336,22 @@ def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVE
     chunks = []
     start = 0
     chunk_index = 0
+    text_len = len(text)
+    # Boundaries are searched in the back half of each window
+    search_offset = max(chunk_size // 2, 0) + 1
+    rfind = text.rfind
     
-    while start < len(text):
+    while start < text_len:
         end = start + chunk_size
         
         # Try to break at sentence boundary
-        if end < len(text):
-            # Look for sentence-ending punctuation
-            for i in range(end, max(start + chunk_size // 2, start), -1):
-                if text[i] in '.!?\n':
-                    end = i + 1
-                    break
+        if end < text_len:
+            # Rightmost sentence-ending punctuation; no newlines survive the
+            # whitespace collapse above, so only . ! ? can occur
+            lo = start + search_offset
+            cut = max(rfind('.', lo, end + 1), rfind('!', lo, end + 1), rfind('?', lo, end + 1))
+            if cut != -1:
+                end = cut + 1
         
         chunk = text[start:end].strip()
         if chunk:
@@ -189,22 +363,24 @@ def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVE
     return chunks
 
 
-def get_document_stats(text: str) -> dict:
+def get_document_stats(text: str, words: List[str] = None) -> dict:
     """
     Get basic statistics about a document
     
     Args:
         text: Document text content
+        words: Optional precomputed text.split() result
         
     Returns:
         Dictionary with document statistics
     """
-    words = text.split()
-    sentences = re.split(r'[.!?]+', text)
+    if words is None:
+        words = text.split()
+    sentences = SENTENCE_END_PATTERN.split(text)
     
     return {
         'character_count': len(text),
         'word_count': len(words),
-        'sentence_count': len([s for s in sentences if s.strip()]),
+        'sentence_count': sum(1 for s in sentences if s and not s.isspace()),
         'page_markers': text.count('--- Page'),
     }
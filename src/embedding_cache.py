@@ -0,0 +1,112 @@
+"""
+Embedding Cache Module
+Content-addressed on-disk cache of chunk embeddings (SQLite)
+Re-ingesting a document skips the encoder for chunks seen before
+"""
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+import sys
+sys.path.append(str(Path(__file__).parent.parent))
+from config import EMBEDDING_CACHE_PATH
+
+
+# One connection per thread, reused across calls
+_local = threading.local()
+
+# Stay under SQLite's host-parameter limit on older builds
+_LOOKUP_BATCH = 900
+
+
+def get_connection():
+    """Get this thread's cache connection, creating the table on first use"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(str(EMBEDDING_CACHE_PATH))
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key BLOB PRIMARY KEY,
+                vector BLOB NOT NULL
+            ) WITHOUT ROWID
+        ''')
+        conn.commit()
+        _local.conn = conn
+    return conn
+
+
+def make_key(signature: str, text: str) -> bytes:
+    """
+    Build the cache key for a chunk
+    
+    Args:
+        signature: Identifies the model and precision that produced the vector
+        text: Chunk text
+    
+    Returns:
+        16-byte BLAKE2b digest
+    """
+    return hashlib.blake2b(
+        f"{signature}\0{text}".encode('utf-8'), digest_size=16
+    ).digest()
+
+
+def get_embeddings(keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+    """
+    Look up cached embeddings
+    
+    Args:
+        keys: Cache keys from make_key
+    
+    Returns:
+        Dictionary of key -> float32 vector for the keys found
+    """
+    found = {}
+    try:
+        conn = get_connection()
+        unique_keys = list(dict.fromkeys(keys))
+        for i in range(0, len(unique_keys), _LOOKUP_BATCH):
+            batch = unique_keys[i:i + _LOOKUP_BATCH]
+            placeholders = ','.join('?' * len(batch))
+            rows = conn.execute(
+                f'SELECT key, vector FROM embeddings WHERE key IN ({placeholders})',
+                batch
+            )
+            for key, vector in rows:
+                found[key] = np.frombuffer(vector, dtype=np.float32)
+    except Exception as e:
+        print(f"Error reading embedding cache: {e}")
+    
+    return found
+
+
+def put_embeddings(items: List[Tuple[bytes, np.ndarray]]) -> bool:
+    """
+    Store embeddings in the cache
+    
+    Args:
+        items: List of (key, vector) pairs
+    
+    Returns:
+        True if successful
+    """
+    conn = None
+    try:
+        conn = get_connection()
+        conn.executemany(
+            'INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)',
+            [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items]
+        )
+        conn.commit()
+        return True
+    except Exception as e:
+        print(f"Error writing embedding cache: {e}")
+        if conn is not None:
+            conn.rollback()
+        return False
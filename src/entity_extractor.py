@@ -49,6 +49,47 @@ PATTERNS = {
     'percentage': r'\b\d+(?:\.\d+)?%',
 }
 
+# Patterns that only match uppercase by construction (and are validated
+# as uppercase) skip case folding
+CASE_SENSITIVE_TYPES = {'pan_number', 'ifsc_code'}
+
+# Compiled once at import; each pattern scans independently
+COMPILED_PATTERNS = {
+    entity_type: re.compile(
+        pattern, 0 if entity_type in CASE_SENSITIVE_TYPES else re.IGNORECASE
+    )
+    for entity_type, pattern in PATTERNS.items()
+}
+
+# Literals a pattern cannot match without; if none occur in the text the
+# regex scan for that type is skipped (a cheap substring prefilter)
+REQUIRED_LITERALS = {
+    'email': ('@',),
+    'date': ('/', '-'),
+    'percentage': ('%',),
+}
+
+
+# A mobile number or unspaced Aadhaar is also a 9-18 digit run, so generic
+# account_number hits overlapping one of these are dropped. These types come
+# before account_number in PATTERNS, so their spans are known by then. PAN,
+# date and IFSC matches cannot overlap an account number: their word
+# boundaries never fall inside a run of 9+ digits.
+ACCOUNT_NUMBER_EXCLUSIONS = {'phone_number', 'aadhaar_number'}
+
+
+# Validator patterns and lookup sets, built once
+_PAN_RE = re.compile(r'^[A-Z]{5}[0-9]{4}[A-Z]$')
+_AADHAAR_RE = re.compile(r'^\d{12}$')
+_IFSC_RE = re.compile(r'^[A-Z]{4}0[A-Z0-9]{6}$')
+_VALID_PAN_4TH = frozenset('PCHFATBLJG')
+
+
+def _may_match(entity_type: str, text: str) -> bool:
+    """Check the literal prefilter for an entity type"""
+    literals = REQUIRED_LITERALS.get(entity_type)
+    return literals is None or any(literal in text for literal in literals)
+
 
 def extract_entities(text: str) -> Dict[str, List[str]]:
     """
@@ -61,9 +102,24 @@ def extract_entities(text: str) -> Dict[str, List[str]]:
         Dictionary mapping entity types to lists of found values
     """
     entities = {}
-    
-    for entity_type, pattern in PATTERNS.items():
-        matches = re.findall(pattern, text, re.IGNORECASE)
+    # Character positions covered by phone/Aadhaar matches
+    excluded = set()
+    
+    for entity_type, pattern in COMPILED_PATTERNS.items():
+        if not _may_match(entity_type, text):
+            continue
+        if entity_type in ACCOUNT_NUMBER_EXCLUSIONS:
+            matches = []
+            for match in pattern.finditer(text):
+                matches.append(match.group())
+                excluded.update(range(*match.span()))
+        elif entity_type == 'account_number':
+            matches = [
+                match.group() for match in pattern.finditer(text)
+                if excluded.isdisjoint(range(*match.span()))
+            ]
+        else:
+            matches = pattern.findall(text)
         # Remove duplicates while preserving order
         unique_matches = list(dict.fromkeys(matches))
         if unique_matches:
@@ -72,27 +128,41 @@ def extract_entities(text: str) -> Dict[str, List[str]]:
     return entities
 
 
-def extract_entities_with_positions(text: str) -> List[Dict]:
+def extract_entities_with_positions(text: str, include_context: bool = True) -> List[Dict]:
     """
     Extract entities with their positions in the text
     
     Args:
         text: Document text content
+        include_context: Include ~30 characters of surrounding text per match;
+            callers can slice text[start:end] themselves when this is False
         
     Returns:
         List of dictionaries with entity info and positions
     """
     results = []
-    
-    for entity_type, pattern in PATTERNS.items():
-        for match in re.finditer(pattern, text, re.IGNORECASE):
-            results.append({
+    # Character positions covered by phone/Aadhaar matches
+    excluded = set()
+    
+    for entity_type, pattern in COMPILED_PATTERNS.items():
+        if not _may_match(entity_type, text):
+            continue
+        for match in pattern.finditer(text):
+            start, end = match.span()
+            if entity_type in ACCOUNT_NUMBER_EXCLUSIONS:
+                excluded.update(range(start, end))
+            elif entity_type == 'account_number' and not excluded.isdisjoint(range(start, end)):
+                continue
+            entity = {
                 'type': entity_type,
                 'value': match.group(),
-                'start': match.start(),
-                'end': match.end(),
-                'context': text[max(0, match.start()-30):min(len(text), match.end()+30)]
-            })
+                'start': start,
+                'end': end,
+            }
+            if include_context:
+                # Slicing clamps at the end of the text
+                entity['context'] = text[max(0, start - 30):end + 30]
+            results.append(entity)
     
     return sorted(results, key=lambda x: x['start'])
 
@@ -106,12 +176,11 @@ def validate_pan(pan: str) -> bool:
     Next 4: Sequential numbers (0001-9999)
     Last: Alphabetic check digit
     """
-    if not re.match(r'^[A-Z]{5}[0-9]{4}[A-Z]$', pan):
+    if not _PAN_RE.match(pan):
         return False
     
     # 4th character validation (holder type)
-    valid_4th = ['P', 'C', 'H', 'F', 'A', 'T', 'B', 'L', 'J', 'G']
-    if pan[3] not in valid_4th:
+    if pan[3] not in _VALID_PAN_4TH:
         return False
     
     return True
@@ -126,11 +195,11 @@ def validate_aadhaar(aadhaar: str) -> bool:
     # Remove spaces
     aadhaar_clean = aadhaar.replace(' ', '')
     
-    if not re.match(r'^\d{12}$', aadhaar_clean):
+    if not _AADHAAR_RE.match(aadhaar_clean):
         return False
     
     # First digit cannot be 0 or 1
-    if aadhaar_clean[0] in ['0', '1']:
+    if aadhaar_clean[0] in '01':
         return False
     
     return True
@@ -144,7 +213,7 @@ def validate_ifsc(ifsc: str) -> bool:
     - 5th: Always 0
     - Last 6: Branch code (alphanumeric)
     """
-    return bool(re.match(r'^[A-Z]{4}0[A-Z0-9]{6}$', ifsc))
+    return bool(_IFSC_RE.match(ifsc))
 
 
 def get_entity_summary(entities: Dict[str, List[str]]) -> Dict:
@@ -185,18 +254,20 @@ def get_entity_summary(entities: Dict[str, List[str]]) -> Dict:
     return summary
 
 
-def calculate_quality_score(text: str, doc_type: str) -> float:
+def calculate_quality_score(text: str, doc_type: str, entities: Dict[str, List[str]] = None) -> float:
     """
     Calculate a data quality score based on extracted entities
     
     Args:
         text: Document text
         doc_type: Type of document
+        entities: Entities already extracted from text (extracted here if omitted)
         
     Returns:
         Quality score from 0 to 100
     """
-    entities = extract_entities(text)
+    if entities is None:
+        entities = extract_entities(text)
     
     # Required entities by document type
     required_entities = {
@@ -216,16 +287,12 @@ def calculate_quality_score(text: str, doc_type: str) -> float:
     found = sum(1 for r in required if r in entities)
     completeness = (found / len(required)) * 100
     
-    # Bonus for validated entities
+    # Bonus for validated entities (one valid value is enough)
     validation_bonus = 0
-    if 'pan_number' in entities:
-        valid_pans = sum(1 for pan in entities['pan_number'] if validate_pan(pan))
-        if valid_pans > 0:
-            validation_bonus += 5
+    if any(validate_pan(pan) for pan in entities.get('pan_number', ())):
+        validation_bonus += 5
     
-    if 'aadhaar_number' in entities:
-        valid_aadhaar = sum(1 for a in entities['aadhaar_number'] if validate_aadhaar(a))
-        if valid_aadhaar > 0:
-            validation_bonus += 5
+    if any(validate_aadhaar(a) for a in entities.get('aadhaar_number', ())):
+        validation_bonus += 5
     
     return min(100, completeness + validation_bonus)
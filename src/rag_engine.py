@@ -6,13 +6,24 @@ Retrieval-Augmented Generation using local, free components:
 - Ollama for LLM inference (free, local)
 """
 import os
+import threading
 from pathlib import Path
 from typing import List, Dict, Optional, Tuple
 import time
 
+import numpy as np
+
 import sys
 sys.path.append(str(Path(__file__).parent.parent))
-from config import EMBEDDING_MODEL, OLLAMA_MODEL, CHROMA_DIR
+from src import embedding_cache
+from config import (
+    EMBEDDING_MODEL, EMBEDDING_MAX_SEQ_LENGTH, EMBEDDING_INT8_ON_CPU,
+    OLLAMA_MODEL, OLLAMA_CHECK_TTL, CHROMA_DIR, DOCUMENT_TYPES,
+    HNSW_SPACE, HNSW_M, HNSW_CONSTRUCTION_EF, HNSW_SEARCH_EF
+)
+
+# Chroma where-clauses for each document type, built once
+DOC_TYPE_WHERE = {doc_type: {"doc_type": doc_type} for doc_type in DOCUMENT_TYPES}
 
 
 class RAGEngine:
@@ -22,36 +33,121 @@ class RAGEngine:
     
     def __init__(self):
         self._embedder = None
+        # Model/precision tag for embedding cache keys, set when the model loads
+        self._embedding_signature = None
         self._chroma_client = None
         self._collection = None
         self._ollama_available = None
+        self._ollama_checked_at = 0.0
+        # Guards lazy loading when uploads are processed on worker threads
+        self._load_lock = threading.Lock()
     
     @property
     def embedder(self):
         """Lazy load the embedding model"""
         if self._embedder is None:
-            from sentence_transformers import SentenceTransformer
-            print(f"Loading embedding model: {EMBEDDING_MODEL}")
-            self._embedder = SentenceTransformer(EMBEDDING_MODEL)
+            with self._load_lock:
+                if self._embedder is None:
+                    self._embedder = self._load_embedder()
         return self._embedder
     
+    @property
+    def embedding_signature(self) -> str:
+        """Model/precision tag for embedding cache keys (loads the model if needed)"""
+        if self._embedding_signature is None:
+            # _load_embedder records the signature alongside the model
+            self._embedder = self.embedder
+        return self._embedding_signature
+    
+    def _load_embedder(self):
+        """Load the sentence-transformer model with reduced-precision inference"""
+        from sentence_transformers import SentenceTransformer
+        import torch
+        print(f"Loading embedding model: {EMBEDDING_MODEL}")
+        model = SentenceTransformer(EMBEDDING_MODEL)
+        model.max_seq_length = min(EMBEDDING_MAX_SEQ_LENGTH, model.max_seq_length)
+        precision = "fp32"
+        
+        if model.device.type == 'cuda':
+            model.half()
+            precision = "fp16"
+        elif EMBEDDING_INT8_ON_CPU:
+            try:
+                model = torch.ao.quantization.quantize_dynamic(
+                    model, {torch.nn.Linear}, dtype=torch.qint8
+                )
+                precision = "int8"
+            except Exception as e:
+                # Some builds ship without a quantized backend; stay in FP32
+                print(f"int8 quantization not available, using FP32: {e}")
+        
+        self._embedding_signature = f"{EMBEDDING_MODEL}:{model.max_seq_length}:{precision}"
+        return model
+    
     @property
     def collection(self):
         """Lazy load ChromaDB collection"""
         if self._collection is None:
-            import chromadb
-            self._chroma_client = chromadb.PersistentClient(path=str(CHROMA_DIR))
-            self._collection = self._chroma_client.get_or_create_collection(
-                name="banking_documents",
-                metadata={"description": "Banking document embeddings"}
-            )
+            with self._load_lock:
+                if self._collection is None:
+                    self._collection = self._load_collection()
         return self._collection
     
+    def _load_collection(self):
+        """Open (or create) the ChromaDB collection"""
+        import chromadb
+        self._chroma_client = chromadb.PersistentClient(path=str(CHROMA_DIR))
+        return self._chroma_client.get_or_create_collection(
+            name="banking_documents",
+            metadata={
+                "description": "Banking document embeddings",
+                "hnsw:space": HNSW_SPACE,
+                "hnsw:M": HNSW_M,
+                "hnsw:construction_ef": HNSW_CONSTRUCTION_EF,
+                "hnsw:search_ef": HNSW_SEARCH_EF
+            }
+        )
+    
+    def _encode(self, texts):
+        """Encode texts in one batched forward pass"""
+        # SentenceTransformer.encode length-sorts inputs internally and
+        # restores the original order, so padding per batch stays minimal
+        return self.embedder.encode(
+            texts,
+            batch_size=32,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
+    
+    def _encode_cached(self, texts: List[str]) -> np.ndarray:
+        """Encode texts, reusing embeddings cached from earlier ingests"""
+        signature = self.embedding_signature
+        keys = [embedding_cache.make_key(signature, text) for text in texts]
+        vectors = embedding_cache.get_embeddings(keys)
+        
+        # Encode each distinct uncached text once
+        missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        if missing:
+            fresh = self._encode(list(missing.values()))
+            new_items = list(zip(missing.keys(), fresh.astype(np.float32, copy=False)))
+            embedding_cache.put_embeddings(new_items)
+            vectors.update(new_items)
+        
+        return np.stack([vectors[key] for key in keys])
+    
+    def warmup(self):
+        """Load the embedding model and run one encode so the first query is fast"""
+        self._encode(["warmup"])
+    
     def check_ollama_available(self) -> bool:
-        """Check if Ollama is running and model is available"""
-        if self._ollama_available is not None:
+        """Check if Ollama is running and model is available (re-probed after OLLAMA_CHECK_TTL)"""
+        now = time.monotonic()
+        if self._ollama_available is not None and now - self._ollama_checked_at < OLLAMA_CHECK_TTL:
             return self._ollama_available
         
+        previous = self._ollama_available
+        self._ollama_checked_at = now
         try:
             import ollama
             # Try to list models
@@ -64,12 +160,14 @@ class RAGEngine:
                 for name in model_names
             ) or len(model_names) > 0
             
-            if self._ollama_available and model_names:
+            # Only report when the status changes, not on every re-probe
+            if self._ollama_available and model_names and previous is not True:
                 print(f"Ollama available with models: {model_names}")
             
             return self._ollama_available
         except Exception as e:
-            print(f"Ollama not available: {e}")
+            if previous is not False:
+                print(f"Ollama not available: {e}")
             self._ollama_available = False
             return False
     
@@ -93,26 +191,22 @@ class RAGEngine:
         if not chunks:
             return []
         
-        embedding_ids = []
         texts = [chunk[0] for chunk in chunks]
+        embedding_ids = [f"{doc_id}_chunk_{chunk_index}" for _, chunk_index in chunks]
         
-        # Generate embeddings for all chunks at once (more efficient)
-        embeddings = self.embedder.encode(texts).tolist()
+        # Generate embeddings for all uncached chunks at once (more efficient)
+        embeddings = self._encode_cached(texts)
         
-        for (chunk_text, chunk_index), embedding in zip(chunks, embeddings):
-            embedding_id = f"{doc_id}_chunk_{chunk_index}"
-            
-            self.collection.add(
-                ids=[embedding_id],
-                embeddings=[embedding],
-                documents=[chunk_text],
-                metadatas=[{
-                    **metadata,
-                    "document_id": doc_id,
-                    "chunk_index": chunk_index
-                }]
-            )
-            embedding_ids.append(embedding_id)
+        # Insert all chunks in a single call; Chroma takes the 2-D array as-is
+        self.collection.add(
+            ids=embedding_ids,
+            embeddings=embeddings,
+            documents=texts,
+            metadatas=[
+                {**metadata, "document_id": doc_id, "chunk_index": chunk_index}
+                for _, chunk_index in chunks
+            ]
+        )
         
         return embedding_ids
     
@@ -133,33 +227,31 @@ class RAGEngine:
         Returns:
             List of result dictionaries with text, metadata, and score
         """
-        # Generate query embedding
-        query_embedding = self.embedder.encode(query).tolist()
+        # Generate query embedding (a 1-row array, passed to Chroma without conversion)
+        query_embeddings = self._encode([query])
         
-        # Build filter if specified
+        # Build filter if specified (Chroma applies it before the vector search)
         where_filter = None
         if filter_doc_type:
-            where_filter = {"doc_type": filter_doc_type}
+            where_filter = DOC_TYPE_WHERE.get(filter_doc_type) or {"doc_type": filter_doc_type}
         
         # Search
         results = self.collection.query(
-            query_embeddings=[query_embedding],
+            query_embeddings=query_embeddings,
             n_results=top_k,
             where=where_filter
         )
         
-        # Format results
-        formatted = []
-        if results['documents'] and results['documents'][0]:
-            for i, doc in enumerate(results['documents'][0]):
-                formatted.append({
-                    'text': doc,
-                    'metadata': results['metadatas'][0][i] if results['metadatas'] else {},
-                    'distance': results['distances'][0][i] if results['distances'] else 0,
-                    'id': results['ids'][0][i] if results['ids'] else None
-                })
+        # Format results (one query, so each field holds a single list)
+        documents = (results.get('documents') or [[]])[0] or []
+        metadatas = (results.get('metadatas') or [[{} for _ in documents]])[0]
+        distances = (results.get('distances') or [[0] * len(documents)])[0]
+        ids = (results.get('ids') or [[None] * len(documents)])[0]
         
-        return formatted
+        return [
+            {'text': doc, 'metadata': metadata, 'distance': distance, 'id': doc_id}
+            for doc, metadata, distance, doc_id in zip(documents, metadatas, distances, ids)
+        ]
     
     def generate_response(
         self,
@@ -287,11 +379,12 @@ ANSWER:"""
         """Get statistics about the vector collection"""
         try:
             count = self.collection.count()
+            ollama_available = self.check_ollama_available()
             return {
                 'total_chunks': count,
                 'embedding_model': EMBEDDING_MODEL,
-                'ollama_available': self.check_ollama_available(),
-                'ollama_model': OLLAMA_MODEL if self.check_ollama_available() else None
+                'ollama_available': ollama_available,
+                'ollama_model': OLLAMA_MODEL if ollama_available else None
             }
         except Exception as e:
             return {'error': str(e)}
@@ -313,12 +406,15 @@ ANSWER:"""
             return False
 
 
-# Singleton instance
+# Singleton instance, shared by every Streamlit session in the process
 _rag_engine = None
+_rag_engine_lock = threading.Lock()
 
 def get_rag_engine() -> RAGEngine:
     """Get the singleton RAG engine instance"""
     global _rag_engine
     if _rag_engine is None:
-        _rag_engine = RAGEngine()
+        with _rag_engine_lock:
+            if _rag_engine is None:
+                _rag_engine = RAGEngine()
     return _rag_engine